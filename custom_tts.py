@@ -1,18 +1,27 @@
 import os
-import pygame
-import threading
-from typing import AsyncIterator, Optional, Callable, Any, Dict
+from typing import AsyncIterator, Optional, Callable, Any, Dict, Union
 import logging
+import re
 from dataclasses import dataclass
-from functools import partial
+from functools import partial, lru_cache
+from math import gcd
 import wave
 import asyncio
-from collections import deque
 import numpy as np
 from livekit.rtc import AudioFrame
 
 logger = logging.getLogger(__name__)
 
+# Checked in order against each LLM response, the first match picks the audio file to play
+INTENT_PATTERNS: list[tuple[re.Pattern, str]] = [
+    (re.compile(r"\b(?:hello|hi|hey|greetings)\b", re.IGNORECASE), "greetings.wav"),
+]
+DEFAULT_AUDIO_FILE = "greetings.wav"
+
+# Every audio file is converted to this format once when it is loaded
+OUTPUT_SAMPLE_RATE = 24000
+OUTPUT_NUM_CHANNELS = 1
+
 @dataclass
 class TTSMetrics:
     """Custom metrics class that matches LiveKit's expectations"""
@@ -36,15 +45,77 @@ class SimpleEventEmitter:
         return decorator(callback)
 
     def emit(self, event: str, data: Any = None):
-        if event in self._events:
-            for callback in self._events[event]:
-                try:
-                    if data is not None:
-                        callback(data)
-                    else:
-                        callback()
-                except Exception as e:
-                    logger.error(f"Error in event callback: {e}")
+        callbacks = self._events.get(event)
+        if not callbacks:
+            return
+        for callback in callbacks:
+            try:
+                if data is not None:
+                    callback(data)
+                else:
+                    callback()
+            except Exception as e:
+                logger.error(f"Error in event callback: {e}")
+
+def _create_audio_frame(
+    data: memoryview,
+    frame_size: int,
+    sample_rate: int,
+    num_channels: int,
+) -> AudioFrame:
+    """Build an AudioFrame from a window of raw int16 PCM bytes"""
+    frame_bytes = frame_size * num_channels * 2  # int16 samples
+    if len(data) < frame_bytes:
+        # Only the last frame of a file is short, zero-fill it to a full frame
+        frame_data: Union[memoryview, bytearray] = bytearray(frame_bytes)
+        frame_data[:len(data)] = data
+    else:
+        frame_data = data
+
+    frame = AudioFrame(
+        data=frame_data,
+        samples_per_channel=frame_size,
+        sample_rate=sample_rate,
+        num_channels=num_channels
+    )
+    return frame
+
+@lru_cache(maxsize=64)
+def _load_wav(path: str) -> tuple[float, list[AudioFrame]]:
+    """Decode a WAV file once and return its duration in seconds and its 24kHz mono 20ms frames.
+
+    The frames are cached and shared by every playback in every session, so callers
+    must treat them as read-only and never modify frame.data in place.
+    """
+    with wave.open(path, 'rb') as wav_file:
+        sample_rate = wav_file.getframerate()
+        num_channels = wav_file.getnchannels()
+        audio_data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+
+    # Convert to the output format here so playback never has to resample
+    if num_channels != OUTPUT_NUM_CHANNELS or sample_rate != OUTPUT_SAMPLE_RATE:
+        samples = audio_data.astype(np.float32)
+        if num_channels != OUTPUT_NUM_CHANNELS:
+            samples = samples.reshape(-1, num_channels).mean(axis=1)
+        if sample_rate != OUTPUT_SAMPLE_RATE:
+            # Only needed for files that aren't already in the output format
+            from scipy.signal import resample_poly
+            factor = gcd(OUTPUT_SAMPLE_RATE, sample_rate)
+            samples = resample_poly(samples, OUTPUT_SAMPLE_RATE // factor, sample_rate // factor)
+        audio_data = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+
+    # Slice into 20ms frames up front so every playback just replays them.
+    # Frames are cut as memoryview windows over the PCM samples, which skips the extra
+    # tobytes() copy per slice (AudioFrame still copies the window into its own buffer).
+    frame_size = int(OUTPUT_SAMPLE_RATE * 0.02)
+    step = frame_size * OUTPUT_NUM_CHANNELS * 2
+    pcm_view = memoryview(audio_data).cast('B')
+    frames = [
+        _create_audio_frame(pcm_view[i:i + step], frame_size, OUTPUT_SAMPLE_RATE, OUTPUT_NUM_CHANNELS)
+        for i in range(0, len(pcm_view), step)
+    ]
+    duration = len(audio_data) / OUTPUT_SAMPLE_RATE / OUTPUT_NUM_CHANNELS
+    return duration, frames
 
 @dataclass
 class TTSCapabilities:
@@ -59,40 +130,47 @@ class AudioFrameWrapper:
 class TTSStream:
     def __init__(self, tts):
         self.tts = tts
-        self.text_queue = deque()
+        self.text_queue: asyncio.Queue = asyncio.Queue()
         self._ended = False
         self._closed = False
-        self._accumulated_text = ""
+        self._parts: list[str] = []
         
     def push_text(self, text: str):
         """Add text to the stream"""
         if self._ended or self._closed:
             return
-        self._accumulated_text += text
+        self._parts.append(text)
         
     def end_input(self):
         """Mark the stream as ended for input"""
+        if self._ended:
+            return
         self._ended = True
-        print(f"\nComplete LLM Response ↗️: {self._accumulated_text}")
+        full_text = "".join(self._parts).strip()
+        print(f"\nComplete LLM Response ↗️: {full_text}")
         # Now that we have the complete response, add it to the queue
-        if self._accumulated_text.strip():
-            self.text_queue.append(self._accumulated_text.strip())
+        if full_text:
+            self.text_queue.put_nowait(full_text)
+        # Sentinel to wake up the consumer and signal end of input
+        self.text_queue.put_nowait(None)
         
     async def aclose(self):
         """Close the stream"""
         self._closed = True
-        self.text_queue.clear()
-        self._accumulated_text = ""
+        while not self.text_queue.empty():
+            self.text_queue.get_nowait()
+        # Wake up a consumer that may still be waiting on the queue
+        self.text_queue.put_nowait(None)
+        self._parts.clear()
         await self.tts.stop()
         
     async def __aiter__(self):
         try:
-            while (not self._ended or self.text_queue) and not self._closed:
-                if not self.text_queue:
-                    await asyncio.sleep(0.1)
-                    continue
-                    
-                text = self.text_queue.popleft()
+            while not self._closed:
+                text = await self.text_queue.get()
+                if text is None:
+                    break
+
                 # Process the complete response
                 audio_filename = self._get_audio_filename(text)
                 async for frame in self.tts.synthesize(audio_filename):
@@ -106,41 +184,23 @@ class TTSStream:
                 
     def _get_audio_filename(self, text: str) -> str:
         """Convert LLM response to audio filename"""
-        # Simple mapping for now - if the intent is greeting, return greetings.wav
-        text = text.lower().strip()
-        if any(greeting in text for greeting in ["hello", "hi", "hey", "greetings"]):
-            return "greetings.wav"
-        # Add more mappings as needed
-        return "greetings.wav"  # Default response
+        # Simple mapping for now - add more entries to INTENT_PATTERNS as needed
+        for pattern, filename in INTENT_PATTERNS:
+            if pattern.search(text):
+                return filename
+        return DEFAULT_AUDIO_FILE
 
 class CustomTTS(SimpleEventEmitter):
+    sample_rate = OUTPUT_SAMPLE_RATE
+    num_channels = OUTPUT_NUM_CHANNELS
+
     def __init__(self, audio_path: str) -> None:
         super().__init__()
         self.audio_path = audio_path
-        pygame.mixer.init()
-        self.is_playing = threading.Event()
         self.capabilities = TTSCapabilities()
         self._current_audio = None
-        self.sample_rate = 24000
-        self.num_channels = 1
         self._agent_output = None
         
-    def _create_audio_frame(self, audio_data: np.ndarray, frame_size: int) -> AudioFrame:
-        if frame_size <= 0:
-            frame_size = len(audio_data)
-            
-        if len(audio_data) < frame_size * self.num_channels:
-            padding = frame_size * self.num_channels - len(audio_data)
-            audio_data = np.pad(audio_data, (0, padding))
-            
-        frame = AudioFrame(
-            data=audio_data.tobytes(),
-            samples_per_channel=frame_size,
-            sample_rate=self.sample_rate,
-            num_channels=self.num_channels
-        )
-        return frame
-        
     async def synthesize(self, filename: str) -> AsyncIterator[AudioFrame]:
         try:
             audio_file = os.path.join(self.audio_path, filename)
@@ -149,11 +209,8 @@ class CustomTTS(SimpleEventEmitter):
                 logger.error(f"Audio file not found: {audio_file}")
                 return
             
-            with wave.open(audio_file, 'rb') as wav_file:
-                self.sample_rate = wav_file.getframerate()
-                self.num_channels = wav_file.getnchannels()
-                duration = wav_file.getnframes() / self.sample_rate
-                audio_data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+            # Decoding is blocking file I/O, keep it off the event loop (cache hits return immediately)
+            duration, frames = await asyncio.to_thread(_load_wav, audio_file)
             
             # Use the correct metric names
             metrics = TTSMetrics(
@@ -165,14 +222,9 @@ class CustomTTS(SimpleEventEmitter):
             
             self._agent_output = True
             
-            frame_size = int(self.sample_rate * 0.02)  # 20ms frames
-            
-            for i in range(0, len(audio_data), frame_size * self.num_channels):
-                chunk = audio_data[i:i + frame_size * self.num_channels]
-                if len(chunk) > 0:
-                    frame = self._create_audio_frame(chunk, frame_size)
-                    yield frame
-                    await asyncio.sleep(0.02)
+            # Cached frames are shared across sessions, consumers must not modify them
+            for frame in frames:
+                yield frame
                     
         except Exception as e:
             logger.error(f"Error playing audio: {e}")
@@ -193,7 +245,3 @@ class CustomTTS(SimpleEventEmitter):
             
     async def close(self):
         await self.stop()
-        pygame.mixer.quit()
-
-    def __del__(self):
-        pygame.mixer.quit()